@@ -30,6 +30,10 @@ choices being the same, except the starting direction, which must be opposite
 to the one used for enciphering.
 """
 import argparse
+import re
+from collections import namedtuple
+from functools import lru_cache
+from math import gcd
 from os.path import exists, isfile
 from string import ascii_lowercase
 from sys import stdin
@@ -42,6 +46,19 @@ DIRECTIONS = ["n", "ne", "e", "se",
               "s", "sw", "w", "nw"]
 LETTERS = ascii_lowercase
 
+# By counting the appearances of each letter that represents a cardinal
+# direction, we may use directions that point to cells other than the ones
+# neighboring the current letter in the alphabet square; e.g.: "nn", "ssww"
+# etc. for letters 2 cells away, or the half winds ("nne", "sse", "ene" etc.)
+# for letters a knight's move away. These are the row and column offsets for
+# each value in DIRECTIONS.
+OFFSETS = [(direction.count("s") - direction.count("n"),
+            direction.count("e") - direction.count("w"))
+           for direction in DIRECTIONS]
+
+CipherTables = namedtuple("CipherTables",
+                          ["schedule", "steps", "non_letters"])
+
 
 def validate_keyword(keyword):
     """Takes a keyword and checks whether it contains only letters.
@@ -52,11 +69,11 @@ def validate_keyword(keyword):
     Raises:
         ValueError: if keyword has characters which are not letters.
     """
-
-    for char in keyword:
-        if char.lower() not in LETTERS:
-            raise ValueError("argument passed to 'keyword' must contain only "
-                             "letters")
+    # Deleting every letter from the keyword leaves only the characters which
+    # are not letters.
+    if keyword.lower().translate(str.maketrans("", "", LETTERS)):
+        raise ValueError("argument passed to 'keyword' must contain only "
+                         "letters")
     return keyword
 
 
@@ -125,6 +142,7 @@ def validate_rotation(rotation):
     return rotation
 
 
+@lru_cache(maxsize=32)
 def build_alphabet(keyword, replacement=REPLACEMENT):
     """Builds a square with the letters of the alphabet, replacing one letter
     so that the alphabet can fit the square.
@@ -135,7 +153,9 @@ def build_alphabet(keyword, replacement=REPLACEMENT):
         replacement: a pair of unique letters.
 
     Returns:
-        The resulting alphabet square as a 2d list.
+        The resulting alphabet square as a string with the letters of each row
+        one after the other. The squares for the 32 most recently used pairs
+        of arguments are cached.
 
     Raises:
         ValueError: If there's a mismatch between the number of available
@@ -145,7 +165,7 @@ def build_alphabet(keyword, replacement=REPLACEMENT):
     remove, replace = validate_replacement(replacement)
 
     keyword = (keyword.lower() + LETTERS).replace(remove, replace)
-    keyword = list(dict.fromkeys(keyword))
+    keyword = "".join(dict.fromkeys(keyword))
 
     # This error should never happen with normal usage, I'm only checking for
     # this in case anyone decides to modify this program for a language with an
@@ -154,23 +174,14 @@ def build_alphabet(keyword, replacement=REPLACEMENT):
     if (len(keyword)) != ALPHABET_ROWS * ALPHABET_COLS:
         raise RuntimeError("the number of available letters to build "
                            "the alphabet square does not match its size")
-
-    alphabet = [["" for _ in range(ALPHABET_ROWS)]
-                for _ in range(ALPHABET_COLS)]
-
-    letter_index = 0
-    for row in range(ALPHABET_ROWS):
-        for col in range(ALPHABET_COLS):
-            alphabet[row][col] = keyword[letter_index]
-            letter_index += 1
-    return alphabet
+    return keyword
 
 
 def find_letter(alphabet, letter):
     """Finds the coordinates of a letter in the alphabet.
 
     Parameters:
-        alphabet: a 2d list containing the alphabet in which to find
+        alphabet: a string containing the alphabet square in which to find
                   the letter. Should be generated with build_alphabet()
         letter: the letter to be found.
 
@@ -178,21 +189,22 @@ def find_letter(alphabet, letter):
         A tuple with the coordinates of the found letter or None if the letter
         is not in the alphabet square.
     """
-    found = None
+    letter = letter.lower()
 
     for row in range(ALPHABET_ROWS):
         for col in range(ALPHABET_COLS):
-            if alphabet[row][col] == letter.lower():
-                found = row, col
-    return found
+            if alphabet[row * ALPHABET_COLS + col] == letter:
+                return row, col
+    return None
 
 
-def encipher(plaintext, keyword="", replacement=REPLACEMENT,
-             direction=DIRECTIONS[0], rotation=ROTATION):
-    """Enciphers a plaintext message using the NorthEast SouthWest Cipher.
+def prepare(keyword="", replacement=REPLACEMENT, direction=DIRECTIONS[0],
+            rotation=ROTATION):
+    """Validates the choices used to encipher messages and works out the
+    tables needed by encipher_bytes(), so they can be reused for any number
+    of messages.
 
     Parameters:
-        plaintext: the plaintext message to be enciphered.
         keyword: a keyword used to reorder the letters of the alphabet.
         replacement: a pair of letters, where the second one replaces the first
                      in the plaintext. A valid replacement consists of exactly
@@ -206,47 +218,154 @@ def encipher(plaintext, keyword="", replacement=REPLACEMENT,
                   steps.
 
     Returns:
-        The resulting ciphertext.
+        A CipherTables tuple, where schedule holds a byte translation table
+        for each direction, in the order they are used, steps holds 1 for
+        every byte that is a letter and 0 for anything else, and non_letters
+        is a compiled pattern splitting a message around anything that isn't
+        a letter.
     """
     alphabet = build_alphabet(keyword, replacement)
     direction = validate_direction(direction)
     rotation = validate_rotation(rotation)
-    remove, replace = replacement
+    return _build_tables(alphabet, replacement.lower(), direction, rotation)
 
-    cardinals = ["n", "e", "s", "w"]
 
-    def update_direction(direction):
-        return DIRECTIONS[(DIRECTIONS.index(direction) + rotation)
-                          % len(DIRECTIONS)]
+@lru_cache(maxsize=32)
+def _build_tables(alphabet, replacement, direction, rotation):
+    """Works out the tables returned by prepare() from an alphabet square and
+    choices which have already been validated. The tables for the 32 most
+    recently used sets of arguments are cached; caching only happens after
+    validation so that invalid arguments are always rejected.
+    """
+    remove, replace = replacement
 
-    output = ""
-    for character in plaintext:
-        is_upper = character.isupper()
+    # The letter missing from the square is enciphered as its replacement.
+    sources = alphabet + remove
+    sources += sources.upper()
+
+    # Rotating by the same number of steps after each letter means the
+    # directions repeat after going around the compass rose as many times as
+    # needed to get back to the starting direction, so only the directions of
+    # one period are needed.
+    start = DIRECTIONS.index(direction)
+    period = len(DIRECTIONS) // gcd(len(DIRECTIONS), rotation)
+
+    # Since the square doesn't change while enciphering, the letter found in
+    # each direction from each letter of the square is worked out in advance,
+    # as a table translating every possible byte: letters to the enciphered
+    # letter of the same case, anything else to itself.
+    schedule = []
+    for step in range(period):
+        row_offset, col_offset = OFFSETS[(start + step * rotation)
+                                         % len(DIRECTIONS)]
+        found = ""
+        for index in range(len(alphabet)):
+            row, col = divmod(index, ALPHABET_COLS)
+            row, col = ((row + row_offset) % ALPHABET_ROWS,
+                        (col + col_offset) % ALPHABET_COLS)
+            found += alphabet[row * ALPHABET_COLS + col]
+        found += found[alphabet.index(replace)]
+        found += found.upper()
+        schedule.append(bytes.maketrans(sources.encode("ascii"),
+                                        found.encode("ascii")))
+
+    # Only letters move on to the next step of the schedule, so they are
+    # either counted when going byte by byte or taken apart from anything
+    # else before enciphering.
+    steps = bytearray(256)
+    for letter in sources.encode("ascii"):
+        steps[letter] = 1
+    non_letters = re.compile(b"([^" + re.escape(sources.encode("ascii")) +
+                             b"]+)")
+
+    return CipherTables(tuple(schedule), bytes(steps), non_letters)
+
+
+def encipher_bytes(plaintext, tables):
+    """Enciphers a plaintext message with tables generated by prepare(),
+    skipping any validation. Useful for enciphering many messages with the
+    same choices.
 
-        if character.lower() == remove:
-            character = replace
+    Parameters:
+        plaintext: the plaintext message to be enciphered, as bytes. Bytes
+                   that aren't ASCII letters are left as they are, so any
+                   ASCII compatible encoding (e.g. UTF-8) may be used.
+        tables: a CipherTables tuple. Should be generated with prepare()
 
-        coordinates = find_letter(alphabet, character)
+    Returns:
+        The resulting ciphertext, as bytes.
+    """
+    schedule, steps, non_letters = tables
+    period = len(schedule)
+
+    # Splitting around anything that isn't a letter leaves the runs of letters
+    # at the even indices and everything else at the odd ones. Splitting costs
+    # about as much as going byte by byte, so it's only worth it when runs
+    # average at least 3 bytes, which is judged from the start of the message.
+    sample = plaintext[:4096]
+    parts = non_letters.split(sample)
+
+    if len(parts) * 3 > len(sample):
+        output = bytearray()
+
+        # Bind the method called for every character to a local name, saving
+        # an attribute lookup each time it is used inside the loop.
+        append = output.append
+
+        step = 0
+        for byte in plaintext:
+            append(schedule[step % period][byte])
+            step += steps[byte]
+        return bytes(output)
+
+    if len(sample) < len(plaintext):
+        parts = non_letters.split(plaintext)
+    letters = b"".join(parts[::2])
+
+    # Every letter at the same step of the schedule is enciphered with the
+    # same table, so instead of going letter by letter, all of the letters
+    # for each step are translated at once and put back in their places.
+    ciphertext = bytearray(letters)
+    for step, table in enumerate(schedule):
+        ciphertext[step::period] = letters[step::period].translate(table)
+
+    position = 0
+    for index in range(0, len(parts), 2):
+        length = len(parts[index])
+        parts[index] = ciphertext[position:position + length]
+        position += length
+    return b"".join(parts)
 
-        if not coordinates:
-            output += character
-            continue
 
-        # By counting the appearances of each letter that represents a cardinal
-        # direction, we may use directions that point to cells other than the
-        # ones neighboring the current letter in the alphabet square; e.g.:
-        # "nn", "ssww" etc. for letters 2 cells away, or the half winds ("nne",
-        # "sse", "ene" etc.) for letters a knight's move away.
-        north, east, south, west = [direction.count(i) for i in cardinals]
+def encipher(plaintext, keyword="", replacement=REPLACEMENT,
+             direction=DIRECTIONS[0], rotation=ROTATION):
+    """Enciphers a plaintext message using the NorthEast SouthWest Cipher.
 
-        row, col = ((coordinates[0] - north + south) % ALPHABET_ROWS,
-                    (coordinates[1] - west + east) % ALPHABET_COLS)
+    Parameters:
+        plaintext: the plaintext message to be enciphered.
+        keyword: a keyword used to reorder the letters of the alphabet.
+        replacement: a pair of letters, where the second one replaces the first
+                     in the plaintext. A valid replacement consists of exactly
+                     two unique letters.
+        direction: the direction from which to start applying the cipher. Valid
+                   choices are any of the values in DIRECTIONS.
+        rotation: the number of rotation steps used to change direction after
+                  each letter. Should be a non-zero integer with absolute value
+                  equal to or lower than half the size of DIRECTIONS. Positive
+                  values are clockwise steps, negative values are widdershins
+                  steps.
 
-        character = alphabet[row][col]
-        direction = update_direction(direction)
+    Returns:
+        The resulting ciphertext.
+    """
+    tables = prepare(keyword, replacement, direction, rotation)
 
-        output += character.upper() if is_upper else character
-    return output.strip()
+    # Lone surrogates (e.g. from undecodable bytes read with surrogateescape)
+    # are passed through the encoding untouched, like any other character
+    # that isn't an ASCII letter.
+    plaintext = plaintext.encode("utf-8", "surrogatepass")
+    ciphertext = encipher_bytes(plaintext, tables)
+    return ciphertext.decode("utf-8", "surrogatepass").strip()
 
 
 def main():
@@ -324,17 +443,11 @@ def main():
 
     if args.message:
         plaintext = args.message
-        args.input = ""
+    elif args.input == "-":
+        plaintext = stdin.read()
     else:
-        plaintext = ""
-
-    if args.input == "-":
-        for line in stdin:
-            plaintext += line
-    elif args.input:
         with open(args.input, "r", encoding="utf-8") as file:
-            for line in file:
-                plaintext += line
+            plaintext = file.read()
 
     ciphertext = encipher(plaintext, args.keyword,
                           args.replacement, args.direction, rotation)